@@ -6,9 +6,12 @@
 # descr: This files implements the basic features required to operate the ADS1298 using the SPI port
          of a Raspberry Pi (tested on RPi 4b).
          
-         The API handles the communication over the SPI port and uses a separate thread - managed by GPIO - 
-         to process samples sent by the ADS1298. Samples received are pushed to a registered callback in 
-         the form of a numpy Array with a length equal to the number of channels (think of observer pattern).
+         The API handles the communication over the SPI port and uses a separate thread - managed by libgpiod
+         when available, RPi.GPIO otherwise - to read samples sent by the ADS1298. Reads are queued to a
+         client thread, so that a slow client never delays the next read. Frames received are pushed to a
+         registered callback in batches of frames_per_batch raw frames (think of observer pattern).
+         Each frame holds the status word followed by one 24 bits sample per channel, see unpack_batch
+         to decode a whole batch at once.
          
          A default Callback that prints out values on screen is provided in this file and registered in the test script.
          
@@ -28,8 +31,9 @@
                         - nb_channels, sets the number of channels {1,8}, default 8
                         - sampling_rate, sets the sampling rate {500,1000,2000, 4000}, default 500
                         - bias_enabled, used to enable/disable Bias drive {True,False}, default True
+                        - frames_per_batch, number of frames pushed at once to the clients {1-32}, default 1
                     Note: changing any option will interrupt any active stream
-                    Note: 2000Hz sampling rate is unstable, it requires the 24 bits conversion to be done in a different thread
+                    Note: at 2000Hz and above, clients should keep up with the sampling rate or the client queue grows
                     Note: gain is set to 12 and is not configurable
                 
                 - registerClient, add a callback to use for data
@@ -61,12 +65,14 @@
   Requirements and setup:
     - numpy:  https://scipy.org/install.html
     - spidev:  https://pypi.python.org/pypi/spidev
+    - numba (optional, JIT compiles the frame decoding):  https://pypi.org/project/numba/
+    - libgpiod v1 python bindings (optional, lighter DRDY edge detection):  apt install python3-libgpiod
     - how to configure SPI on raspberry Pi: https://www.raspberrypi.org/documentation/hardware/raspberrypi/spi/README.md
 """
 
-import struct
+from queue import SimpleQueue
 from threading import Lock, Thread
-from time import sleep
+from time import perf_counter, sleep
 
 import numpy as np
 
@@ -77,9 +83,35 @@ try:
 except ImportError:
     STUB_API = True
 
+# GPIO output and levels bound once, output is a no-op in stub mode
+if STUB_API:
+    def _gpio_output(pin, level):
+        pass
+
+    _GPIO_HIGH, _GPIO_LOW = 1, 0
+else:
+    _gpio_output = GPIO.output
+    _GPIO_HIGH, _GPIO_LOW = GPIO.HIGH, GPIO.LOW
+
+# DRDY edges are read from the gpiochip character device when the libgpiod v1 bindings are available
+GPIOD_API = False
+try:
+    import gpiod
+    GPIOD_API = hasattr(gpiod, "LINE_REQ_EV_FALLING_EDGE")
+except ImportError:
+    pass
+
+NUMBA_API = False
+try:
+    from numba import njit
+    NUMBA_API = True
+except ImportError:
+    pass
+
 # exg data scaling function
 SCALE_TO_UVOLT = (5 / 12) / (2 ** 24)  # TODO: verify
 NUM_CHANNELS = 8
+FRAME_SIZE = 3 + 3 * NUM_CHANNELS  # status word + one 24 bits sample per channel
 
 """
 # conv24bitsToFloat(unpacked)
@@ -91,45 +123,153 @@ NUM_CHANNELS = 8
 """
 
 
-def convert_24b_data(unpacked, fmt=">i"):
-    """Convert 24bit data coded on 3 bytes to a proper integer"""
+def convert_24b_unsigned(unpacked):
+    """Convert 24bit data coded on 3 bytes to an unsigned integer"""
     if len(unpacked) != 3:
         raise ValueError("Input should be 3 bytes long.")
 
-    literal_read = struct.pack("3B", *unpacked)
+    # 3byte int, MSB first, bytes cast to int so numpy uint8 input doesn't overflow when shifted
+    return (int(unpacked[0]) << 16) | (int(unpacked[1]) << 8) | int(unpacked[2])
 
-    # 3byte int in 2s compliment
-    prefix = b"\xff" if unpacked[0] > 127 else b"\x00"
 
-    # unpack little endian(>) signed integer(i) (makes unpacking platform independent)
-    return struct.unpack(fmt, prefix + literal_read)[0]
+def convert_24b_data(unpacked):
+    """Convert 24bit data coded on 3 bytes to a proper integer"""
+    # 3byte int in 2s compliment, flipping the sign bit and subtracting it back sign extends without branching
+    return (convert_24b_unsigned(unpacked) ^ 0x800000) - 0x800000
 
 
 def convert_24b_to_float(unpacked):
     return convert_24b_data(unpacked) * SCALE_TO_UVOLT
 
 
+"""
+# unpack_frame(raw, n_ch, out)
+# @brief converts a complete frame read from the ADS1298 (status word followed by
+#        n_ch samples) to the status word and the samples scaled to uVolt
+#        JIT compiled when numba is available, and then runs without holding the GIL,
+#        otherwise unrolled for NUM_CHANNELS and vectorized with numpy for any other number of channels
+# @param raw (uint8 array) frame of 3+n_ch*3 bytes
+# @param n_ch number of channels in the frame
+# @param out (float64 array) optional, preallocated array of n_ch samples to write into,
+#        reused on every call so the caller must copy it to retain the samples
+# @return (status word as int, float64 array of n_ch samples)
+"""
+
+if NUMBA_API:
+    @njit(cache=True, nogil=True, fastmath=True, boundscheck=False)
+    def unpack_frame(raw, n_ch, out=None):
+        status = (np.int64(raw[0]) << 16) | (np.int64(raw[1]) << 8) | np.int64(raw[2])
+
+        if out is None:
+            out = np.empty(n_ch, np.float64)
+        for i in range(n_ch):
+            o = 3 + 3 * i
+            # place the sample in the upper 24 bits, the arithmetic shift does the sign extension
+            v = np.int32((np.int32(raw[o]) << 24) | (np.int32(raw[o + 1]) << 16) | (np.int32(raw[o + 2]) << 8))
+            out[i] = (v >> 8) * SCALE_TO_UVOLT
+
+        return status, out
+else:
+    def _unrolled_unpack_frame_source(n_ch):
+        """Generate the source of _unpack_frame_unrolled, specialized for n_ch channels"""
+        lines = ["def _unpack_frame_unrolled(raw, out):",
+                 "    b = bytes(raw)"]
+        for i in range(n_ch):
+            o = 3 + 3 * i
+            lines.append(f"    out[{i}] = ((((b[{o}] << 16) | (b[{o + 1}] << 8) | b[{o + 2}]) ^ 0x800000) - 0x800000)"
+                         f" * {SCALE_TO_UVOLT!r}")
+        lines.append("    return (b[0] << 16) | (b[1] << 8) | b[2], out")
+        return "\n".join(lines)
+
+    _unrolled_namespace = {}
+    exec(_unrolled_unpack_frame_source(NUM_CHANNELS), _unrolled_namespace)
+    _unpack_frame_unrolled = _unrolled_namespace["_unpack_frame_unrolled"]
+
+    def unpack_frame(raw, n_ch, out=None):
+        if out is None:
+            out = np.empty(n_ch, np.float64)
+
+        if n_ch == NUM_CHANNELS:
+            return _unpack_frame_unrolled(raw, out)
+
+        raw = np.frombuffer(raw, np.uint8)
+        status = (int(raw[0]) << 16) | (int(raw[1]) << 8) | int(raw[2])
+        payload = raw[3:3 + 3 * n_ch].reshape(n_ch, 3).astype(np.int32)
+        np.multiply(((payload[:, 0] << 24) | (payload[:, 1] << 16) | (payload[:, 2] << 8)) >> 8,
+                    SCALE_TO_UVOLT, out=out)
+
+        return status, out
+
+
+"""
+# unpack_batch(raw, n_ch, out)
+# @brief converts a batch of M frames, as pushed to the clients, to the status words and
+#        the samples scaled to uVolt, in a single call
+#        the kernel is JIT compiled when numba is available and then runs without holding
+#        the GIL, letting the DRDY thread read while a client decodes, vectorized with numpy otherwise
+# @param raw (bytes-like) batch of M*(3+n_ch*3) bytes
+# @param n_ch number of channels in a frame
+# @param out (float64 array) optional, preallocated Mxn_ch array of samples to write into,
+#        reused on every call so the caller must copy it to retain the samples
+# @return (int32 array of M status words, float64 array of Mxn_ch samples)
+"""
+
+if NUMBA_API:
+    @njit(cache=True, nogil=True, fastmath=True, boundscheck=False)
+    def _unpack_batch_kernel(raw, n_ch, status, out):
+        frame_size = 3 + 3 * n_ch
+        for f in range(out.shape[0]):
+            base = f * frame_size
+            status[f] = (np.int32(raw[base]) << 16) | (np.int32(raw[base + 1]) << 8) | np.int32(raw[base + 2])
+            for i in range(n_ch):
+                o = base + 3 + 3 * i
+                # place the sample in the upper 24 bits, the arithmetic shift does the sign extension
+                v = np.int32((np.int32(raw[o]) << 24) | (np.int32(raw[o + 1]) << 16) | (np.int32(raw[o + 2]) << 8))
+                out[f, i] = (v >> 8) * SCALE_TO_UVOLT
+else:
+    def _unpack_batch_kernel(raw, n_ch, status, out):
+        frames = raw.reshape(-1, 3 + 3 * n_ch).astype(np.int32)
+        status[:] = (frames[:, 0] << 16) | (frames[:, 1] << 8) | frames[:, 2]
+
+        payload = frames[:, 3:].reshape(-1, n_ch, 3)
+        np.multiply(((payload[..., 0] << 24) | (payload[..., 1] << 16) | (payload[..., 2] << 8)) >> 8,
+                    SCALE_TO_UVOLT, out=out)
+
+
+def unpack_batch(raw, n_ch, out=None):
+    raw = np.frombuffer(raw, np.uint8)
+    nb_frames = len(raw) // (3 + 3 * n_ch)
+
+    if out is None:
+        out = np.empty((nb_frames, n_ch), np.float64)
+    status = np.empty(nb_frames, np.int32)
+    _unpack_batch_kernel(raw, n_ch, status, out)
+
+    return status, out
+
+
 """
 DefaultCallback
 @brief used as default client callback for tests 
-@data byte array of 1xN, where N is the number of channels
+@data byte buffer of 1xM*FRAME_SIZE, where M is the number of frames in the batch
 """
 
 
 def default_callback(raw):
-    samples = np.zeros(NUM_CHANNELS)
-    status_word = convert_24b_data(raw[0:3], ">I") & 0xffffff
+    for start in range(0, len(raw), FRAME_SIZE):
+        status_word = convert_24b_unsigned(raw[start:start + 3])
 
-    assert status_word >> 20 == 0b1100, "Data stream out of sync"
+        assert status_word >> 20 == 0b1100, "Data stream out of sync"
 
-    loff_stat_p = (status_word >> 12) & 0xff
-    loff_stat_n = (status_word >> 4) & 0xff
+        loff_stat_p = (status_word >> 12) & 0xff
+        loff_stat_n = (status_word >> 4) & 0xff
 
-    for i in range(0, NUM_CHANNELS):
-        samples[i] = convert_24b_to_float(raw[(i * 3 + 3): ((i + 1) * 3 + 3)])
+        # plain python is enough to print a frame, see unpack_frame for vectorized decoding
+        samples = [((((raw[o] << 16) | (raw[o + 1] << 8) | raw[o + 2]) ^ 0x800000) - 0x800000) * SCALE_TO_UVOLT
+                   for o in range(start + 3, start + FRAME_SIZE, 3)]
 
-    print(f"LOFF P{loff_stat_p:08b} N{loff_stat_n:08b}")
-    print(f"samples: {samples}")
+        print(f"LOFF P{loff_stat_p:08b} N{loff_stat_n:08b}")
+        print(f"samples: {' '.join(f'{sample:.6g}' for sample in samples)}")
 
 
 """ ADS1298 registers map """
@@ -164,35 +304,19 @@ RDATA = 0x12
 
 
 class Ads1298Api:
-    # spi device
-    spi = None
-
-    # thread processing inputs
-    stubThread = None
-    APIAlive = True
-
-    # lock over SPI port
-    spi_lock = None
-
-    # array of client handles
-    clientUpdateHandles = []
-
-    # device configuration
-    nb_channels = 8  # {1-8}
-    sampling_rate = 500  # {500,1000,2000,4000}
-    bias_enabled = False  # {True, False}
-
-    # True when a data stream is active
-    stream_active = False
-
-    # Reconfigurable pin mapping
+    __slots__ = ("spi", "stubThread", "APIAlive", "stub_pool", "drdyThread", "drdy_line", "drdy_alive",
+                 "clientThread", "client_queue", "spi_lock", "clientUpdateHandles", "nb_channels", "sampling_rate",
+                 "bias_enabled", "frames_per_batch", "batch_buffer", "batch_index", "batch_lock",
+                 "_spi_tx_zeros",
+                 "_spi_single_reg_frame", "stream_active", "config_registers",
+                 "__dict__")  # only created when the pin mapping is reaffected on an instance
+
+    # Reconfigurable pin mapping, on the class, a subclass or an instance (before open_device)
     START_PIN = 22
     nRESET_PIN = 24
     nPWRDN_PIN = 25
     DRDY_PIN = 23
-
-    # This mirrors the register state on the ADS1298
-    config_registers: dict[int, int] = dict()
+    GPIO_CHIP = "gpiochip0"
 
     """ PUBLIC
     # Constructor
@@ -200,8 +324,55 @@ class Ads1298Api:
     """
 
     def __init__(self):
-        if not STUB_API:
-            self.spi = spidev.SpiDev()
+        # spi device
+        self.spi = None if STUB_API else spidev.SpiDev()
+
+        # thread processing inputs
+        self.stubThread = None
+        self.APIAlive = True
+
+        # pregenerated frames replayed in stub mode
+        self.stub_pool = None
+
+        # thread waiting on DRDY edges, when using libgpiod
+        self.drdyThread = None
+        self.drdy_line = None
+        self.drdy_alive = False  # cleared by close_device only, DRDY keeps being watched across streams
+
+        # thread pushing the queued batches to the clients
+        self.clientThread = None
+        self.client_queue = None
+
+        # lock over SPI port
+        self.spi_lock = None
+
+        # array of client handles
+        self.clientUpdateHandles = []
+
+        # device configuration
+        self.nb_channels = 8  # {1-8}
+        self.sampling_rate = 500  # {500,1000,2000,4000}
+        self.bias_enabled = False  # {True, False}
+        self.frames_per_batch = 1  # {1-32}
+
+        # frames read from the ADS1298, pushed to the clients once full
+        # the lock orders the DRDY thread filling the batch against streams starting and stopping
+        self.batch_buffer = None
+        self.batch_index = 0
+        self.batch_lock = Lock()
+
+        # zeros clocked out on MOSI while reading a frame, immutable as spidev writes
+        # the received bytes back into a list argument
+        self._spi_tx_zeros = bytes(FRAME_SIZE)
+
+        # WREG frame reused by single register writes
+        self._spi_single_reg_frame = bytearray(3)
+
+        # True when a data stream is active
+        self.stream_active = False
+
+        # This mirrors the register state on the ADS1298, indexed by register address (0x00-0x19)
+        self.config_registers = bytearray(32)
 
     def __del__(self):
         self.close_device()
@@ -212,8 +383,12 @@ class Ads1298Api:
     """
 
     def open_device(self):
+        # batches are queued for the clients, the client thread is started once the device is up
+        self.client_queue = SimpleQueue()
+
         if not STUB_API:
-            # open and configure SPI port
+            # open and configure SPI port, CE1 is the chip select of /dev/spidev0.1 and is
+            # driven by the SPI controller only, it must not be toggled as a debug/scope pin
             self.spi.open(0, 1)
             self.spi.max_speed_hz = 500000
             self.spi.mode = 0b01  # SPI settings are CPOL = 0 and CPHA = 1.
@@ -227,21 +402,36 @@ class Ads1298Api:
             GPIO.setup(self.nPWRDN_PIN, GPIO.OUT, initial=GPIO.LOW)
 
             # setup DRDY callback
-            GPIO.setup(self.DRDY_PIN, GPIO.IN)
-            GPIO.add_event_detect(self.DRDY_PIN, GPIO.FALLING, callback=self.drdy_callback)
+            if GPIOD_API:
+                self.drdy_line = gpiod.Chip(self.GPIO_CHIP).get_line(self.DRDY_PIN)
+                self.drdy_line.request(consumer="Ads1298Api", type=gpiod.LINE_REQ_EV_FALLING_EDGE)
+                self.drdy_alive = True
+                self.drdyThread = Thread(target=self.drdy_task)
+                self.drdyThread.start()
+            else:
+                GPIO.setup(self.DRDY_PIN, GPIO.IN)
+                GPIO.add_event_detect(self.DRDY_PIN, GPIO.FALLING, callback=self.drdy_callback)
 
         else:
             # setup fake data generator
             print("stubbed mode")
+            self.stub_pool = np.random.randint(0, 256, size=(4096, FRAME_SIZE), dtype=np.uint8)
+            self.stub_pool[:, 0] = 0xC0  # status word sync bits
             self.stubThread = Thread(target=self.stub_task)
             self.stubThread.start()
 
         # spi port mutex
         self.spi_lock = Lock()
 
+        self.allocate_batch_buffer()
+
         # init the ADS1298
         self.ads1298_startup_sequence()
 
+        # clients are updated from their own thread, as a daemon so that it never holds the process on exit
+        self.clientThread = Thread(target=self.client_task, daemon=True)
+        self.clientThread.start()
+
     """ PUBLIC
     # closeDevice
     # @brief close and clean up the SPI, GPIO and running thread
@@ -253,9 +443,21 @@ class Ads1298Api:
         if STUB_API:
             self.stubThread.join()
         else:
+            if self.drdyThread is not None:
+                self.drdy_alive = False
+                self.drdyThread.join()
+                self.drdy_line.release()
+                self.drdyThread = None
+
             self.spi.close()
             GPIO.cleanup()
 
+        # let the client thread flush the queue and exit
+        if self.clientThread is not None:
+            self.client_queue.put(None)
+            self.clientThread.join()
+            self.clientThread = None
+
     """ PUBLIC
     # startEegStream
     # @brief Init an eeg data stream
@@ -268,8 +470,10 @@ class Ads1298Api:
         # setup ExG mode
         self.setup_exg_mode()
 
-        # start the stream
-        self.stream_active = True
+        # start the stream, any partial batch left by a previous stream is pushed first
+        with self.batch_lock:
+            self.flush_batch()
+            self.stream_active = True
         self.set_start(True)
         self.spi_transmit_byte(RDATAC)
 
@@ -285,8 +489,10 @@ class Ads1298Api:
         # setup test mode
         self.setup_test_mode()
 
-        # start the stream
-        self.stream_active = True
+        # start the stream, any partial batch left by a previous stream is pushed first
+        with self.batch_lock:
+            self.flush_batch()
+            self.stream_active = True
         self.set_start(True)
         self.spi_transmit_byte(RDATAC)
 
@@ -298,7 +504,9 @@ class Ads1298Api:
     def stop_stream(self):
         # stop any ongoing ADS stream
         self.spi_transmit_byte(SDATAC)
-        self.stream_active = False
+        with self.batch_lock:
+            self.stream_active = False
+            self.flush_batch()
         self.APIAlive = False
 
     """ PUBLIC
@@ -316,9 +524,10 @@ class Ads1298Api:
     #        no parameter validation take place, make sure to provide valid value
     #   - sampling_rate {500, 1000, 2000, 4000}
     #   - bias_enabled {True, False}
+    #   - frames_per_batch {1-32}
     """
 
-    def configure(self, sampling_rate=None, bias_enabled=None):
+    def configure(self, sampling_rate=None, bias_enabled=None, frames_per_batch=None):
         assert not self.stream_active
 
         if sampling_rate is not None:
@@ -327,6 +536,10 @@ class Ads1298Api:
         if bias_enabled is not None:
             self.bias_enabled = bias_enabled
 
+        if frames_per_batch is not None:
+            self.frames_per_batch = frames_per_batch
+            self.allocate_batch_buffer()
+
     # %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
     #   ADS1298 control
     # %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
@@ -364,24 +577,21 @@ class Ads1298Api:
         self.spi_write_single_reg(REG_CONFIG2, 0x00)
         self.configure_all_channels(0x60)
 
-        self.spi_write_single_reg(REG_BIAS_SENSP, 0xFF)
-        self.spi_write_single_reg(REG_BIAS_SENSN, 0x01)
+        # BIAS_SENSP and BIAS_SENSN are adjacent, written in one burst
+        self.spi_write_multiple_reg(REG_BIAS_SENSP, bytes((0xFF, 0x01)))
 
         self.configure_dc_leads_off(True)
         self.setup_bias_drive()
 
     def configure_dc_leads_off(self, enable: bool):
+        # LOFF_SENSP, LOFF_SENSN and LOFF_FLIP are adjacent, written in one burst
         if enable:
             self.spi_write_single_reg(REG_LOFF, 0x93)
-            self.spi_write_single_reg(REG_LOFF_SENSP, 0xFF)
-            self.spi_write_single_reg(REG_LOFF_SENSN, 0xFF)
-            self.spi_write_single_reg(REG_LOFF_FLIP, 0xFF)
+            self.spi_write_multiple_reg(REG_LOFF_SENSP, bytes((0xFF, 0xFF, 0xFF)))
             self.spi_write_single_reg(REG_CONFIG4, 0x02)
         else:
             self.spi_write_single_reg(REG_LOFF, 0x00)
-            self.spi_write_single_reg(REG_LOFF_SENSP, 0x00)
-            self.spi_write_single_reg(REG_LOFF_SENSN, 0x00)
-            self.spi_write_single_reg(REG_LOFF_FLIP, 0x00)
+            self.spi_write_multiple_reg(REG_LOFF_SENSP, bytes((0x00, 0x00, 0x00)))
             self.spi_write_single_reg(REG_CONFIG4, 0x00)
 
     """ PRIVATE
@@ -420,8 +630,7 @@ class Ads1298Api:
         self.spi_write_single_reg(REG_CONFIG2, 0xC0)
 
         # disable any bias
-        self.spi_write_single_reg(REG_BIAS_SENSP, 0x00)
-        self.spi_write_single_reg(REG_BIAS_SENSN, 0x00)
+        self.spi_write_multiple_reg(REG_BIAS_SENSP, bytes((0x00, 0x00)))
 
         # input shorted
         self.configure_all_channels(0x01)
@@ -460,22 +669,71 @@ class Ads1298Api:
 
         print("Configuring bias registers")
         reg_value = (2 ** NUM_CHANNELS) - 1
-        self.spi_write_single_reg(REG_BIAS_SENSP, reg_value)
-        self.spi_write_single_reg(REG_BIAS_SENSN, reg_value)
+        self.spi_write_multiple_reg(REG_BIAS_SENSP, bytes((reg_value, reg_value)))
         self.spi_write_single_reg(REG_CONFIG3, 0xEC)
 
+    """ PRIVATE
+    # allocateBatchBuffer
+    # @brief (re)allocate the buffer holding a batch of frames
+    """
+
+    def allocate_batch_buffer(self):
+        self.batch_buffer = bytearray(self.frames_per_batch * FRAME_SIZE)
+        self.batch_index = 0
+
+    """ PRIVATE
+    # flushBatch
+    # @brief queue the frames of a partial batch for the clients, so that the end of a stream
+    #        is not lost, must be called holding batch_lock
+    """
+
+    def flush_batch(self):
+        if self.batch_index:
+            self.client_queue.put(bytes(self.batch_buffer[:self.batch_index * FRAME_SIZE]))
+            self.batch_index = 0
+
     """ PRIVATE
     # stubTask
     # @brief activated in stub mode, will generate fake data
     """
 
     def stub_task(self):
+        index = 0
+        next_batch_time = perf_counter()
+
         while self.APIAlive:
+            nb_frames = self.frames_per_batch
             if self.stream_active:
-                raw = b"\xC0" + np.random.bytes(2 + 3 * NUM_CHANNELS)[0:]
-                for handle in self.clientUpdateHandles:
+                if index + nb_frames > len(self.stub_pool):
+                    index = 0
+                self.client_queue.put(self.stub_pool[index:index + nb_frames].tobytes())
+                index += nb_frames
+
+            # sleep until the next batch is due, rather than a fixed period, so the loop overhead doesn't add up
+            next_batch_time += nb_frames / float(self.sampling_rate)
+            delay = next_batch_time - perf_counter()
+            if delay > 0:
+                sleep(delay)
+            else:
+                next_batch_time = perf_counter()
+
+    """ PRIVATE
+    # clientTask
+    # @brief push the queued batches to all clients, until a None batch is queued
+    #        a client raising only loses that batch, the other clients and batches are still served
+    """
+
+    def client_task(self):
+        while True:
+            raw = self.client_queue.get()
+            if raw is None:
+                return
+
+            for handle in self.clientUpdateHandles:
+                try:
                     handle(raw)
-            sleep(1.0 / float(self.sampling_rate))
+                except Exception as e:
+                    print(f"Client {handle} failed: {e}")
 
     def check_device_id(self):
         res = self.spi_read_reg(REG_ID)
@@ -487,11 +745,31 @@ class Ads1298Api:
     #   GPIO Interface
     # %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
 
+    """ PRIVATE
+    # drdy_task
+    # @brief wait for DRDY falling edges on the gpiochip, when using libgpiod. All the
+             edges pending on wake-up are drained at once and trigger a single read,
+             as only the latest conversion can be read from the ADS1298
+    """
+
+    def drdy_task(self):
+        while self.drdy_alive:
+            # time out regularly to notice the device being closed
+            if not self.drdy_line.event_wait(sec=1):
+                continue
+
+            # like the RPi.GPIO event thread, a failed read only loses that frame
+            try:
+                self.drdy_line.event_read_multiple()
+                self.drdy_callback(None)
+            except Exception as e:
+                print(f"DRDY handling failed: {e}")
+
     """ PRIVATE
     # drdy_callback
     # @brief callback triggered on DRDY falling edge. When this happens, if the stream
-             is active, will get all the sample from the ADS1298 and update all
-             clients
+             is active, will get all the sample from the ADS1298 and append them to the
+             batch buffer. Once the batch is full, it is queued for the clients
     # @param state, state of the pin to read (not used)
     """
 
@@ -502,11 +780,23 @@ class Ads1298Api:
             return
 
         # read 24 + n*24 bits or 3+n*3 bytes
-        raw = self.spi_read_multiple_bytes(3 + NUM_CHANNELS * 3)
+        frame = self.spi_read_frame()
+
+        with self.batch_lock:
+            # the stream may have been stopped, and its partial batch flushed, during the read
+            if not self.stream_active:
+                return
+
+            offset = self.batch_index * FRAME_SIZE
+            self.batch_buffer[offset:offset + FRAME_SIZE] = frame
+
+            self.batch_index += 1
+            if self.batch_index < self.frames_per_batch:
+                return
+            self.batch_index = 0
 
-        # broadcast raw
-        for handle in self.clientUpdateHandles:
-            handle(raw)
+            # queue a copy, the buffer is reused for the next batch
+            self.client_queue.put(bytes(self.batch_buffer))
 
     """ PRIVATE
     # setStart
@@ -548,13 +838,18 @@ class Ads1298Api:
         self.set_pin(self.nPWRDN_PIN, state)
 
     def configure_all_channels(self, config: int):
-        self.spi_write_multiple_reg(REG_CHnSET_BASE, [config] * NUM_CHANNELS)
+        self.config_registers[REG_CHnSET_BASE:REG_CHnSET_BASE + NUM_CHANNELS] = bytes((config,)) * NUM_CHANNELS
 
-    def set_pin(self, pin: int, state: bool):
         if STUB_API:
             return
 
-        GPIO.output(pin, GPIO.HIGH if state else GPIO.LOW)
+        # WREG header padded with the same value for every CHnSET register
+        frame = bytes((REG_CHnSET_BASE | 0x40, NUM_CHANNELS - 1)).ljust(2 + NUM_CHANNELS, bytes((config,)))
+        with self.spi_lock:
+            self.spi.xfer2(frame)
+
+    def set_pin(self, pin: int, state: bool):
+        _gpio_output(pin, _GPIO_HIGH if state else _GPIO_LOW)
 
     # %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
     #   SPI Interface
@@ -587,7 +882,10 @@ class Ads1298Api:
             return
 
         with self.spi_lock:
-            self.spi.xfer2([reg | 0x40, 0x00, byte])
+            frame = self._spi_single_reg_frame
+            frame[0] = reg | 0x40
+            frame[2] = byte
+            self.spi.xfer2(frame)
 
     """ PRIVATE
     # SPI_writeMultipleReg
@@ -598,28 +896,45 @@ class Ads1298Api:
     # @param byte_array, array of bytes containing registers values
     """
 
-    def spi_write_multiple_reg(self, start_reg: int, byte_array: list[int]):
-        for index, addr in enumerate(range(start_reg, start_reg + len(byte_array))):
-            self.config_registers[addr] = byte_array[index]
+    def spi_write_multiple_reg(self, start_reg: int, byte_array: bytes):
+        self.config_registers[start_reg:start_reg + len(byte_array)] = byte_array
 
         if STUB_API:
             return
 
         with self.spi_lock:
-            self.spi.xfer2([start_reg | 0x40, len(byte_array) - 1] + byte_array)
+            self.spi.xfer2(bytes((start_reg | 0x40, len(byte_array) - 1)) + byte_array)
 
     """ PRIVATE
     # SPI_readMultipleBytes
     # @brief read multiple bytes from the SPI port
     # @param nb_bytes, nb of bytes to read
+    # @return bytes read, as a contiguous buffer that np.frombuffer consumes without copy
     """
 
     def spi_read_multiple_bytes(self, nb_bytes):
         if STUB_API:
-            return []
+            return b""
 
         with self.spi_lock:
-            return self.spi.xfer2([0x00] * nb_bytes)
+            if nb_bytes > len(self._spi_tx_zeros):
+                return bytes(self.spi.xfer2(bytes(nb_bytes)))
+            return bytes(self.spi.xfer2(self._spi_tx_zeros[:nb_bytes]))
+
+    """ PRIVATE
+    # SPI_readFrame
+    # @brief read a complete frame (status word + samples) from the SPI port
+    #        in a single transfer, CS held low and no delay between bytes
+    #        only called while streaming, so the SPI lock is not taken: spidev already
+    #        serializes transfers and a frame racing a command only returns a stale frame
+    # @return frame read, as bytes
+    """
+
+    def spi_read_frame(self):
+        if STUB_API:
+            return b""
+
+        return bytes(self.spi.xfer2(self._spi_tx_zeros))
 
     def spi_read_reg(self, reg):
         if STUB_API:
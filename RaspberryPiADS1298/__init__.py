@@ -1,3 +1,3 @@
-from .Ads1298Api import Ads1298Api, NUM_CHANNELS
+from .Ads1298Api import Ads1298Api, NUM_CHANNELS, unpack_batch, unpack_frame
 
 __version__ = "0.1.0"
@@ -8,6 +8,7 @@ setup(name = 'RaspberryPiADS1298',
       license='MIT',
       packages=find_packages(),
       install_requires=['numpy'],
+      extras_require={'numba': ['numba']},
       url='https://github.com/torfinnberset/RaspberryPiADS1298',
       keywords=['device', 'control', 'eeg', 'emg', 'ekg', 'exg', 'ads1298', 'raspberry', 'pi'],  # arbitrary keywords
       zip_safe=False)